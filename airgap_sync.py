@@ -26,8 +26,10 @@ Run the script and follow the prompts to integrate feeds into the database.
 import os
 import sys
 import json
+import itertools
 import mariadb
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 # --- Configuration ---
 FEEDS_BASE_DIR = "AirgapIntel_Feeds"  # Base directory where feed folders are located
@@ -39,11 +41,14 @@ DATABASE_CONFIG = {
     "database": "misp",  # Replace with your MISP database name
     "connect_timeout": 5  # Set timeout to 5 seconds
 }
+EXISTING_FEEDS_SCAN_LIMIT = 100000  # Above this many feeds, look up folder names with IN (...) batches instead
+SCAN_WORKERS = 16  # Feed folders listed in parallel, helps on network-attached storage
+FETCH_BATCH_SIZE = 10000  # Rows pulled per fetchmany() when loading existing feed names
+LOOKUP_BATCH_SIZE = 1000  # Max folder names per IN (...) existence query
+INSERT_BATCH_SIZE = 500  # Max feeds per bulk INSERT batch, keeps packets under max_allowed_packet
 # --- End Configuration ---
 
-def ascii_art():
-    """Prints ASCII art for Airgap Sync."""
-    print(r"""
+_ASCII_ART = r"""
  _______ _________ _______  _______  _______  _______    _______           _        _______ 
 (  ___  )\__   __/(  ____ )(  ____ \(  ___  )(  ____ )  (  ____ \|\     /|( (    /|(  ____ \
 | (   ) |   ) (   | (    )|| (    \/| (   ) || (    )|  | (    \/( \   / )|  \  ( || (    \/
@@ -52,130 +57,228 @@ def ascii_art():
 | (   ) |   | |   | (\ (   | | \_  )| (   ) || (              ) |   ) (   | | \   || |      
 | )   ( |___) (___| ) \ \__| (___) || )   ( || )        /\____) |   | |   | )  \  || (____/\
 |/     \|\_______/|/   \__/(_______)|/     \||/         \_______)   \_/   |/    )_)(_______/
-    """)
+    """
 
+_SHOW_UNIQUE_INDEXES_SQL = "SHOW INDEX FROM feeds WHERE Non_unique = 0"
+_UNIQUE_INDEX_DDL = {"name": "ADD UNIQUE KEY uk_feeds_name (name)", "url": "ADD UNIQUE KEY uk_feeds_url (url)"}
+_SELECT_ALL_FEEDS_SQL = f"SELECT name, id FROM feeds LIMIT {EXISTING_FEEDS_SCAN_LIMIT + 1}"
+_SELECT_EXIST_SQL = "SELECT name, id FROM feeds WHERE name IN ({placeholders})"
+_INSERT_FEED_SQL = """
+INSERT IGNORE INTO feeds (name, provider, url, rules, enabled, distribution, sharing_group_id, tag_id, 
+                          `default`, source_format, fixed_event, delta_merge, event_id, publish, override_ids, 
+                          settings, input_source, delete_local_file, lookup_visible, headers, caching_enabled, 
+                          force_to_ids, orgc_id, tag_collection_id)
+VALUES (?, ?, ?, NULL, 1, 0, 0, 0, 0, ?, 0, 0, 0, 1, 0, 0, 'network', 0, 1, NULL, 1, 0, 1, 0)
+"""  # `default` is wrapped in backticks since it's a reserved word
 
-def test_database_connection(db_config):
-    """Tests the database connection using the provided configuration."""
-    try:
-        with mariadb.connect(**db_config) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT 1")  # Simple test query
-                result = cursor.fetchone()
-                return result[0] == 1, None  # Connection successful, no error message
-    except mariadb.Error as e:
-        return False, f"[ERROR] Database connection test failed!\nMariaDB Error: {e}"  # Improved error message
-    except TimeoutError:
-        return False, "[ERROR] Database connection timed out! Check credentials and network connectivity."
+
+def ascii_art():
+    """Prints ASCII art for Airgap Sync."""
+    print(_ASCII_ART)
+
+
+def _missing_unique_indexes(conn):
+    """Returns the feeds columns among name and url that have no single-column UNIQUE index."""
+    index_columns = {}
+    with conn.cursor() as cursor:
+        cursor.execute(_SHOW_UNIQUE_INDEXES_SQL)
+        # SHOW INDEX columns: Table, Non_unique, Key_name, Seq_in_index, Column_name, ...
+        for row in cursor.fetchall():
+            index_columns.setdefault(row[2], []).append(row[4])
+    unique_columns = {columns[0] for columns in index_columns.values() if len(columns) == 1}
+    return [column for column in _UNIQUE_INDEX_DDL if column not in unique_columns]
+
+
+def _load_existing_feeds(conn):
+    """Returns {name: id} for every feed in the database, or None if the table holds more than
+    EXISTING_FEEDS_SCAN_LIMIT feeds."""
+    existing = {}
+    row_count = 0
+    # Unbuffered: rows are pulled in FETCH_BATCH_SIZE blocks and go straight into the
+    # dict instead of first being held as one full result list
+    with conn.cursor(buffered=False) as cursor:
+        cursor.execute(_SELECT_ALL_FEEDS_SQL)
+        while rows := cursor.fetchmany(FETCH_BATCH_SIZE):
+            existing.update(rows)
+            row_count += len(rows)
+    return existing if row_count <= EXISTING_FEEDS_SCAN_LIMIT else None
+
+
+def _find_existing_feeds(conn, feed_names):
+    """Returns {name: id} for the given feed names already in the database."""
+    with conn.cursor() as cursor:
+        cursor.execute(_SELECT_EXIST_SQL.format(placeholders=", ".join(["?"] * len(feed_names))), feed_names)
+        return dict(cursor.fetchall())
+
+
+def _scan_folder(folder_path):
+    """Lists a feed folder in a single pass. Returns (data_files, source_format).
+
+    The manifest is detected from the listing itself, so no separate exists() check is made.
+    """
+    manifest_entry = None
+    csv_seen = False
+    data_files = []
+    with os.scandir(folder_path) as it:
+        for e in it:
+            n = e.name
+            if n == "manifest.json":
+                manifest_entry = e
+                continue
+            data_files.append(n)
+            # Only the 4-char suffix is lowercased, and only until the first CSV is seen
+            if not csv_seen and n[-4:].lower() == ".csv":
+                csv_seen = True
+    
+    has_manifest = manifest_entry is not None
+    source_format = "misp" if has_manifest else "csv" if csv_seen else DEFAULT_FEED_FORMAT
+    return data_files or ([manifest_entry.name] if has_manifest else []), source_format
 
 
-def find_new_feed_folders(base_dir, db_config):
-    """Finds new feed folders that are not in the database."""
-    new_feed_folders = []
-    if not os.path.isdir(base_dir):
+def iter_new_feed_folders(base_dir, conn):
+    """Yields feed folders that are not in the database yet, as they are scanned."""
+    # The listing doubles as the existence check for base_dir, and entry.is_dir() reuses the
+    # file type reported by the directory read instead of stat()ing every folder
+    try:
+        with os.scandir(base_dir) as it:
+            folder_entries = [entry for entry in it if entry.is_dir()]
+    except (FileNotFoundError, NotADirectoryError):
         print(f"Error: Base feed directory '{base_dir}' not found.")
-        return new_feed_folders
+        return
 
     try:
-        with mariadb.connect(**db_config) as conn:
-            with conn.cursor() as cursor:
-                for folder_name in os.listdir(base_dir):
-                    folder_path = os.path.join(base_dir, folder_name)
-                    if not os.path.isdir(folder_path):
-                        continue
-                    
-                    manifest_path = os.path.join(folder_path, "manifest.json")
-                    csv_files = [f for f in os.listdir(folder_path) if f.lower().endswith(".csv")]
-                    data_files = [f for f in os.listdir(folder_path) if f != "manifest.json"]
-                    
-                    cursor.execute("SELECT id FROM feeds WHERE name = ?", (folder_name,))
-                    existing_feed = cursor.fetchone()
-                    if existing_feed:
-                        print(f"[INFO] Feed folder '{folder_name}' already exists in the database (ID: {existing_feed[0]}). Skipping.")
-                        continue
-                    
-                    source_format = "misp" if os.path.exists(manifest_path) else "csv" if csv_files else DEFAULT_FEED_FORMAT
-                    
-                    if data_files or os.path.exists(manifest_path):
-                        new_feed_folders.append({
-                            "folder_name": folder_name,
-                            "folder_path": folder_path,
-                            "data_files": data_files or [os.path.basename(manifest_path)],
-                            "source_format": source_format
-                        })
+        # MISP feed tables are small, so a single query fetches every existing name and the
+        # folders are then checked against it in memory
+        existing = _load_existing_feeds(conn)
+        if existing is None:
+            # Very large feeds table: only look up the names found on disk, one IN (...)
+            # query per batch
+            names = [entry.name for entry in folder_entries]
+            existing = {}
+            for i in range(0, len(names), LOOKUP_BATCH_SIZE):
+                existing.update(_find_existing_feeds(conn, names[i:i + LOOKUP_BATCH_SIZE]))
     except mariadb.Error as e:
         print(f"Error checking for existing feeds in database: {e}")
-    
-    return new_feed_folders
+        return
+
+    # Folders already in the database are skipped before their contents are read
+    new_entries = []
+    for entry in folder_entries:
+        # Exact match; the UNIQUE index still drops anything the column collation treats as equal
+        feed_id = existing.get(entry.name)
+        if feed_id:
+            print(f"[INFO] Feed folder '{entry.name}' already exists in the database (ID: {feed_id}). Skipping.")
+            continue
+        new_entries.append(entry)
+
+    # Folder listings are independent and latency-bound on network storage, so they run in
+    # parallel; results still come back in directory order
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        scans = executor.map(_scan_folder, [entry.path for entry in new_entries])
+        for entry, (data_files, source_format) in zip(new_entries, scans):
+            if data_files:
+                yield {
+                    "folder_name": entry.name,
+                    "folder_path": entry.path,
+                    "data_files": data_files,
+                    # Feed URL relative to the network path, so main() only has to prefix it
+                    "url_path": f"{quote(entry.name)}/{quote(data_files[0])}",
+                    "source_format": source_format
+                }
 
 
-def add_feed_to_db(feed_name, feed_url, source_format, db_config):
-    """Adds a new feed to the MISP database."""
+def add_feeds_to_db(rows, conn):
+    """Adds new feeds to the MISP database using the connector's bulk executemany.
+
+    rows is an iterable of (feed_name, feed_url, source_format) tuples, consumed in batches
+    of INSERT_BATCH_SIZE. Duplicates are
+    skipped by the server through INSERT IGNORE and the UNIQUE indexes on feeds.name and feeds.url.
+    Either every feed is added or, on error, none are.
+    """
     try:
-        with mariadb.connect(**db_config) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT id FROM feeds WHERE name = ? OR url = ?", (feed_name, feed_url))
-                if cursor.fetchone():
-                    print(f"[INFO] Feed '{feed_name}' already exists. Skipping.")
-                    return
-                
-                query = """
-                INSERT INTO feeds (name, provider, url, rules, enabled, distribution, sharing_group_id, tag_id, 
-                                  `default`, source_format, fixed_event, delta_merge, event_id, publish, override_ids, 
-                                  settings, input_source, delete_local_file, lookup_visible, headers, caching_enabled, 
-                                  force_to_ids, orgc_id, tag_collection_id)
-                VALUES (?, ?, ?, NULL, 1, 0, 0, 0, 0, ?, 0, 0, 0, 1, 0, 0, 'network', 0, 1, NULL, 1, 0, 1, 0)
-                """  # `default` is wrapped in backticks since it's a reserved word
-                
-                cursor.execute(query, (feed_name, feed_name, feed_url, source_format))
-                conn.commit()
-                print(f"[INFO] Feed '{feed_name}' ({source_format} format) added to MISP database with URL: {feed_url}")
+        # All batches share one transaction, so the server syncs its log once per run. Relaxing
+        # innodb_flush_log_at_trx_commit or sync_binlog would save nothing beyond that single
+        # fsync, and both are server-wide settings that cannot be scoped to this session.
+        # unique_checks stays on because INSERT IGNORE depends on the UNIQUE indexes.
+        conn.begin()
+        total = inserted = 0
+        rows = iter(rows)
+        # The INSERT is prepared on the first batch; later batches only bind parameters
+        with conn.cursor(prepared=True) as cursor:
+            while chunk := list(itertools.islice(rows, INSERT_BATCH_SIZE)):
+                cursor.executemany(_INSERT_FEED_SQL, [(name, name, url, source_format) for name, url, source_format in chunk])
+                inserted += cursor.rowcount
+                total += len(chunk)
+        conn.commit()
+        # INSERT IGNORE only reports how many rows it inserted, not which ones it dropped
+        print(f"[INFO] {inserted} feed(s) inserted, {total - inserted} skipped as already present "
+              f"(name or URL collision).")
     except mariadb.Error as e:
-        print(f"Error adding feed '{feed_name}' to database: {e}")
+        try:
+            conn.rollback()
+        except mariadb.Error:
+            pass  # Connection is gone; the server discards the open transaction on its own
+        print(f"Error adding feeds to database, no feeds were added: {e}")
 
 
 def main():
     ascii_art()
     
-    success, error_message = test_database_connection(DATABASE_CONFIG)
-    if not success:
-        print(error_message)
+    try:
+        conn = mariadb.connect(**DATABASE_CONFIG, autocommit=False)
+    except mariadb.Error as e:
+        print(f"[ERROR] Database connection test failed!\nMariaDB Error: {e}")
+        sys.exit(1)
+    except TimeoutError:
+        print("[ERROR] Database connection timed out! Check credentials and network connectivity.")
         sys.exit(1)
+    # Connecting already authenticated against the server, so no separate test query is needed
     print("[SUCCESS] Database connection test successful!")
     
-    if input("Continue with feed import to MISP database? (yes/no): ").lower() != "yes":
-        sys.exit(0)
+    # A single connection is reused for every query of the run
+    with conn:
+        # Duplicates are only rejected by the server, so refuse to run without the UNIQUE indexes
+        try:
+            missing = _missing_unique_indexes(conn)
+        except mariadb.Error as e:
+            print(f"[ERROR] Could not read the indexes of the feeds table!\nMariaDB Error: {e}")
+            sys.exit(1)
+        if missing:
+            print(f"[ERROR] The feeds table has no UNIQUE index on: {', '.join(missing)}. Duplicate feeds could be inserted.")
+            print(f"Add the missing index(es) once with: ALTER TABLE feeds {', '.join(_UNIQUE_INDEX_DDL[column] for column in missing)};")
+            sys.exit(1)
     
-    new_folders = find_new_feed_folders(FEEDS_BASE_DIR, DATABASE_CONFIG)
-    if not new_folders:
-        print("No new feed folders found. Exiting.")
-        return
+        if input("Continue with feed import to MISP database? (yes/no): ").lower() != "yes":
+            sys.exit(0)
     
-    print("\n--- New feed folders found: ---")
-    for folder in new_folders:
-        print(f"- {folder['folder_name']} (Format: {folder['source_format']})")
+        # Collected up front: the user confirms the full list before anything is inserted
+        new_folders = list(iter_new_feed_folders(FEEDS_BASE_DIR, conn))
+        if not new_folders:
+            print("No new feed folders found. Exiting.")
+            return
     
-    if input("\nAdd all these new feeds to the MISP database? (yes/no): ").lower() != "yes":
-        print("User cancelled. Exiting.")
-        sys.exit(0)
+        print("\n--- New feed folders found: ---")
+        for folder in new_folders:
+            print(f"- {folder['folder_name']} (Format: {folder['source_format']})")
     
-    network_path = input("Enter the base network path (e.g., http://192.168.1.37:8080/): ").strip()
-    if not network_path.startswith(("http://", "https://")):
-        print("Invalid network path. Exiting.")
-        sys.exit(1)
-    if not network_path.endswith("/"):
-        network_path += "/"
+        if input("\nAdd all these new feeds to the MISP database? (yes/no): ").lower() != "yes":
+            print("User cancelled. Exiting.")
+            sys.exit(0)
+    
+        network_path = input("Enter the base network path (e.g., http://192.168.1.37:8080/): ").strip()
+        if not network_path.startswith(("http://", "https://")):
+            print("Invalid network path. Exiting.")
+            sys.exit(1)
+        if not network_path.endswith("/"):
+            network_path += "/"
     
-    print("\n--- Adding feeds to MISP database... ---")
-    for folder in new_folders:
-        data_filename = folder['data_files'][0] if folder['data_files'] else None
-        if data_filename:
-            feed_url = urljoin(network_path, urljoin(folder['folder_name'] + "/", data_filename))
-            add_feed_to_db(folder['folder_name'], feed_url, folder['source_format'], DATABASE_CONFIG)
-        else:
-            print(f"Warning: No data file in '{folder['folder_name']}'. Skipping.")
+        print("\n--- Adding feeds to MISP database... ---")
+        # iter_new_feed_folders only yields folders with a data file, so every one has a url_path
+        rows = ((folder['folder_name'], network_path + folder['url_path'], folder['source_format'])
+                for folder in new_folders)
+        add_feeds_to_db(rows, conn)
     
-    print("\n--- Feed database integration completed. ---")
+        print("\n--- Feed database integration completed. ---")
 
 
 if __name__ == "__main__":